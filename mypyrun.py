@@ -1,11 +1,13 @@
 from __future__ import absolute_import, print_function
 
 import argparse
+import codecs
 import subprocess
 import os
 import os.path
 import sys
 import re
+import threading
 import fnmatch
 import json
 from collections import defaultdict
@@ -15,6 +17,16 @@ try:
 except ImportError:
     from backports import configparser
 
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+try:
+    from functools import lru_cache
+except ImportError:
+    from backports.functools_lru_cache import lru_cache
+
 if False:
     from typing import *
 
@@ -29,66 +41,240 @@ ALL = None
 # choose an exit that does not conflict with mypy's
 PARSING_FAIL = 100
 
+_READ_BUFFER_SIZE = 1 << 16
+# number of writes to collect before writing to a non-interactive stdout
+_WRITE_BATCH_SIZE = 512
+
+# filename:lineno:status:msg, where lineno is optional.  the line number may
+# be followed by a column, and by an end line and column, when mypy is run with
+# `show_column_numbers` or `show_error_end`; these are not reported.  trailing
+# whitespace is left on msg: a lazy `.*?\s*$` to drop it backtracks, and is
+# slower than calling strip() on the result.
+_LINE_RE = re.compile(r'^(?P<filename>[^:]+):(?:(?P<lineno>\d+)(?::\d+){0,3}:)?'
+                      r'\s*(?P<status>error|note|warning):\s*(?P<msg>.*)$')
+
+# patterns are searched for in the stripped message text.  most messages start
+# with a fixed phrase, and anchoring those patterns with `^` means the rest of
+# the message does not have to be scanned for them.
 _FILTERS = [
-    ('revealed_type', 'Revealed type is'),
+    ('revealed_type', '^Revealed type is'),
     # DEFINITION ERRORS --
     # Type annotation errors:
-    ('invalid_syntax', 'syntax error in type comment'),
-    ('wrong_number_of_args', 'Type signature has '),
-    ('misplaced_annotation', 'misplaced type annotation'),
+    ('invalid_syntax', '^syntax error in type comment'),
+    ('wrong_number_of_args', '^Type signature has '),
+    ('misplaced_annotation', '^misplaced type annotation'),
     ('not_defined', ' is not defined'),  # in seminal
-    ('invalid_type_arguments', '(".*" expects .* type argument)'  # in typeanal
-                               '(Optional.* must have exactly one type argument)'
-                               '(is not subscriptable)'),
-    ('generator_expected', 'The return type of a generator function should be '),  # in messages
+    ('invalid_type_arguments', '(?:".*" expects .* type argument)'  # in typeanal
+                               '(?:Optional.* must have exactly one type argument)'
+                               '(?:is not subscriptable)'),
+    ('generator_expected', '^The return type of a generator function should be '),  # in messages
     # Advanced signature errors:
-    ('orphaned_overload', 'Overloaded .* will never be matched'),  # in messages
+    ('orphaned_overload', '^Overloaded .* will never be matched'),  # in messages
     ('already_defined', 'already defined'),  # in seminal
     # Signature incompatible with function internals:
-    ('return_expected', 'Return value expected'),
-    ('return_not_expected', 'No return value expected'),
-    ('incompatible_return', 'Incompatible return value type'),
-    ('incompatible_yield', 'Incompatible types in "yield"'),
-    ('incompatible_arg', 'Argument .* has incompatible type'),
-    ('incompatible_default_arg', 'Incompatible default for argument'),
+    ('return_expected', '^Return value expected'),
+    ('return_not_expected', '^No return value expected'),
+    ('incompatible_return', '^Incompatible return value type'),
+    ('incompatible_yield', '^Incompatible types in "yield"'),
+    ('incompatible_arg', '^Argument .* has incompatible type'),
+    ('incompatible_default_arg', '^Incompatible default for argument'),
     # Signature/class incompatible with super class:
-    ('incompatible_subclass_signature', 'Signature .* incompatible with supertype'),
-    ('incompatible_subclass_return', 'Return type .* incompatible with supertype'),
-    ('incompatible_subclass_arg', 'Argument .* incompatible with supertype'),
-    ('incompatible_subclass_attr', 'Incompatible types in assignment '
+    ('incompatible_subclass_signature', '^Signature .* incompatible with supertype'),
+    ('incompatible_subclass_return', '^Return type .* incompatible with supertype'),
+    ('incompatible_subclass_arg', '^Argument .* incompatible with supertype'),
+    ('incompatible_subclass_attr', '^Incompatible types in assignment '
                                    '\(expression has type ".*", base class '
                                    '".*" defined the type as ".*"\)'),
 
     # MISC --
-    ('need_annotation', 'Need type annotation'),
-    ('missing_module', 'Cannot find module '),
+    ('need_annotation', '^Need type annotation'),
+    ('missing_module', '^Cannot find module '),
 
     # USAGE ERRORS --
     # Special case Optional/None issues:
-    ('no_attr_none_case', 'Item "None" of ".*" has no attribute'),
+    ('no_attr_none_case', '^Item "None" of ".*" has no attribute'),
     ('incompatible_subclass_attr_none_case',
-     'Incompatible types in assignment \(expression has type ".*", base class '
+     '^Incompatible types in assignment \(expression has type ".*", base class '
      '".*" defined the type as "None"\)'),
     # Other:
-    ('incompatible_list_comprehension', 'List comprehension has incompatible type'),
-    ('cannot_assign_to_method', 'Cannot assign to a method'),
-    ('not_enough_arguments', 'Too few arguments'),
+    ('incompatible_list_comprehension', '^List comprehension has incompatible type'),
+    ('cannot_assign_to_method', '^Cannot assign to a method'),
+    ('not_enough_arguments', '^Too few arguments'),
     ('not_callable', ' not callable'),
-    ('no_attr', '.* has no attribute'),
+    ('no_attr', ' has no attribute'),
     ('not_indexable', ' not indexable'),
-    ('invalid_index', 'Invalid index type'),
+    ('invalid_index', '^Invalid index type'),
     ('not_iterable', ' not iterable'),
-    ('not_assignable_by_index', 'Unsupported target for indexed assignment'),
-    ('no_matching_overload', 'No overload variant of .* matches argument type'),
-    ('incompatible_assignment', 'Incompatible types in assignment'),
+    ('not_assignable_by_index', '^Unsupported target for indexed assignment'),
+    ('no_matching_overload', '^No overload variant of .* matches argument type'),
+    ('incompatible_assignment', '^Incompatible types in assignment'),
     ('invalid_return_assignment', 'does not return a value'),
-    ('unsupported_operand', 'Unsupported .*operand '),
-    ('abc_with_abstract_attr', "Cannot instantiate abstract class .* with abstract attribute"),
+    ('unsupported_operand', '^Unsupported .*operand '),
+    ('abc_with_abstract_attr', "^Cannot instantiate abstract class .* with abstract attribute"),
 ]
 
 FILTERS = [(n, re.compile(s)) for n, s in _FILTERS]
 FILTERS_SET = frozenset(n for n, s in FILTERS)
 
+
+_REGEX_SPECIAL_CHARS = '\\.^$*+?{}[]|()'
+
+
+def _has_top_level_alternation(pattern):
+    # type: (str) -> bool
+    """
+    Whether a regular expression has a `|` outside of any group or character
+    class, which splits the whole pattern into alternatives.
+
+    Parameters
+    ----------
+    pattern : str
+
+    Returns
+    -------
+    bool
+    """
+    depth = 0
+    i = 0
+    n = len(pattern)
+    while i < n:
+        c = pattern[i]
+        if c == '\\':
+            i += 1
+        elif c == '[':
+            # skip the class.  a `]` straight after the opening `[` or `[^`
+            # is a literal.
+            i += 1
+            if pattern[i:i + 1] == '^':
+                i += 1
+            if pattern[i:i + 1] == ']':
+                i += 1
+            while i < n and pattern[i] != ']':
+                if pattern[i] == '\\':
+                    i += 1
+                i += 1
+        elif c == '(':
+            depth += 1
+        elif c == ')':
+            depth -= 1
+        elif c == '|' and depth == 0:
+            return True
+        i += 1
+    return False
+
+
+def _split_leading_literal(pattern):
+    # type: (str) -> Tuple[Optional[str], str]
+    """
+    Split a regular expression into the literal character it starts with and
+    the remainder.
+
+    Parameters
+    ----------
+    pattern : str
+
+    Returns
+    -------
+    Tuple[Optional[str], str]
+        the leading character, or None (and the whole pattern) if the pattern
+        does not start with a plain literal
+    """
+    if (pattern and pattern[0] not in _REGEX_SPECIAL_CHARS and
+            pattern[1:2] not in ('*', '+', '?', '{')):
+        return pattern[0], pattern[1:]
+    return None, pattern
+
+
+def _alternation(filters):
+    # type: (List[Tuple[str, str]]) -> str
+    """
+    Join filters into a single alternation, with each filter's branch ending
+    in an empty named group which `lastgroup` uses to report the error code.
+
+    Filters are bucketed by their leading character, so that the engine only
+    tries the filters which can start at a given position.  A filter may be
+    moved ahead of earlier filters which start with a different character,
+    since they can never match at the same position.  A filter which does not
+    start with a plain literal could match wherever the others do, so it gets
+    a branch of its own, and no later filter is moved ahead of it.  The
+    branches are therefore tried in the same order as the filters would be in
+    a flat alternation, and ties go to the filter listed first.
+
+    Patterns must not have a top-level `|` (see `_combine`).
+
+    Parameters
+    ----------
+    filters : List[Tuple[str, str]]
+        error codes and patterns
+
+    Returns
+    -------
+    str
+    """
+    buckets = []  # type: List[Tuple[Optional[str], List[str]]]
+    by_lead = {}  # type: Dict[str, List[str]]
+    for code, pattern in filters:
+        lead, rest = _split_leading_literal(pattern)
+        branch = '(?:%s)(?P<%s>)' % (rest, code)
+        if lead is None:
+            buckets.append((None, [branch]))
+            by_lead = {}
+        elif lead in by_lead:
+            by_lead[lead].append(branch)
+        else:
+            by_lead[lead] = [branch]
+            buckets.append((lead, by_lead[lead]))
+
+    return '|'.join(
+        branches[0] if lead is None
+        else '%s(?:%s)' % (re.escape(lead), '|'.join(branches))
+        for lead, branches in buckets)
+
+
+def _combine(filters):
+    # type: (List[Tuple[str, str]]) -> Pattern
+    """
+    Fold the filters into a single regular expression, so that a message is
+    scanned once.
+
+    The earliest match in the message wins.  Filters anchored to the start of
+    the message are grouped behind a single `^`, and are tried before the
+    unanchored ones; otherwise ties go to the filter listed first.  A pattern
+    with a top-level `|` is wrapped in a group first, so that neither its
+    `^` nor its leading character is taken to apply to all its alternatives.
+
+    Parameters
+    ----------
+    filters : List[Tuple[str, str]]
+        error codes and patterns
+
+    Returns
+    -------
+    Pattern
+    """
+    anchored = []  # type: List[Tuple[str, str]]
+    unanchored = []  # type: List[Tuple[str, str]]
+    for code, pattern in filters:
+        if _has_top_level_alternation(pattern):
+            pattern = '(?:%s)' % pattern
+        if pattern.startswith('^'):
+            anchored.append((code, pattern[1:]))
+        else:
+            unanchored.append((code, pattern))
+
+    parts = []
+    if anchored:
+        parts.append('^(?:%s)' % _alternation(anchored))
+    if unanchored:
+        parts.append(_alternation(unanchored))
+    return re.compile('|'.join(parts))
+
+
+# one combined search is several times faster than trying the filters one by
+# one, even from a generated chain of `if regex.search(msg)` tests, since the
+# engine rejects most filters without returning to Python.
+_COMBINED = _combine(_FILTERS)
+
 COLORS = {
     'error': 'red',
     'warning': 'yellow',
@@ -127,17 +313,37 @@ TERM_COLORS = {
 TERM_RESET = '\033[0m'
 
 
-def colored(text, color=None, attrs=None):
+def _ansi_prefix(color=None, attrs=None):
+    # type: (Optional[str], Optional[List[str]]) -> str
     esc = '\033[%dm%s'
+    prefix = ''
     if color is not None:
-        text = esc % (TERM_COLORS[color], text)
+        prefix = esc % (TERM_COLORS[color], prefix)
 
     if attrs is not None:
         for attr in attrs:
-            text = esc % (TERM_ATTRIBUTES[attr], text)
+            prefix = esc % (TERM_ATTRIBUTES[attr], prefix)
 
-    text += TERM_RESET
-    return text
+    return prefix
+
+
+def colored(text, color=None, attrs=None):
+    # type: (str, Optional[str], Optional[List[str]]) -> str
+    return _ansi_prefix(color, attrs) + text + TERM_RESET
+
+
+# escape sequences used by `get_formatter()`, keyed on (status, dimmed):
+# (filename, lineno, status and message, error key)
+REPORT_PREFIXES = {
+    (status, dimmed): (
+        _ansi_prefix('cyan', display_attrs),
+        _ansi_prefix(None, display_attrs),
+        _ansi_prefix(color, display_attrs),
+        _ansi_prefix('magenta', display_attrs),
+    )
+    for status, color in COLORS.items()
+    for dimmed, display_attrs in ((False, None), (True, ['dark']))
+}
 
 
 def match(regex_list, s):
@@ -160,73 +366,137 @@ class Options(object):
         'error_filters',
         'warning_filters',
     ]
-    # error codes:
-    select = None  # type: Optional[Set[str]]
-    ignore = None  # type: Optional[Set[str]]
-    warn = None  # type: Optional[Set[str]]
-    # paths:
-    include = None  # type: List[Pattern]
-    exclude = None  # type: List[Pattern]
-    # messages:
-    error_filters = None  # type: List[Pattern]
-    warning_filters = None  # type: List[Pattern]
-
-    # global-only options:
-    args = None  # type: List[str]
-    color = True
-    show_ignored = False
-    show_error_keys = False
-    daemon = False
-    mypy_executable = None  # type: Optional[str]
+    __slots__ = (
+        'select',
+        'ignore',
+        'warn',
+        'include',
+        'exclude',
+        'error_filters',
+        'warning_filters',
+        'args',
+        'color',
+        'show_ignored',
+        'show_error_keys',
+        'daemon',
+        'mypy_executable',
+        '_status_map',
+        '_default_status',
+    )
 
     def __init__(self):
-        self.select = ALL
-        self.ignore = set()
-        self.warn = set()
-        self.include = []
-        self.exclude = []
-        self.error_filters = []
-        self.warning_filters = []
-        self.args = []
+        # error codes:
+        self.select = ALL  # type: Optional[AbstractSet[str]]
+        self.ignore = set()  # type: Optional[AbstractSet[str]]
+        self.warn = set()  # type: Optional[AbstractSet[str]]
+        # paths:
+        self.include = []  # type: List[Pattern]
+        self.exclude = None  # type: Optional[Pattern]
+        # messages:
+        self.error_filters = []  # type: List[Pattern]
+        self.warning_filters = []  # type: List[Pattern]
+
+        # global-only options:
+        self.args = []  # type: List[str]
+        self.color = True
+        self.show_ignored = False
+        self.show_error_keys = False
+        self.daemon = False
+        self.mypy_executable = None  # type: Optional[str]
+
+        # resolved by freeze():
+        self._status_map = None  # type: Optional[Dict[str, Optional[str]]]
+        self._default_status = None  # type: Optional[str]
 
     def is_excluded_path(self, path):
         # type: (str) -> bool
-        return match(self.exclude, path)
+        return self.exclude is not None and self.exclude.search(path) is not None
 
     def is_included_path(self, path):
         # type: (str) -> bool
         return match(self.include, path)
 
-    def get_status(self, error_code, msg):
-        # type: (str, str) -> Optional[str]
+    def freeze(self):
+        # type: () -> None
         """
-        Determine whether an error code is an error, warning, or ignored
+        Freeze the error code sets and resolve the status of every error code,
+        so that `get_status` is a single lookup.
+
+        Must be called again if `select`, `ignore` or `warn` are changed.
+        """
+        if self.select is not ALL:
+            self.select = frozenset(self.select)
+        if self.ignore is not ALL:
+            self.ignore = frozenset(self.ignore)
+        if self.warn is not ALL:
+            self.warn = frozenset(self.warn)
+        self._status_map = {code: self._resolve_status(code)
+                            for code in FILTERS_SET}
+        self._default_status = self._resolve_status(None)
+
+    def _resolve_status(self, error_code):
+        # type: (Optional[str]) -> Optional[str]
+        """
+        Determine whether an error code is an error, warning, or ignored,
+        before any message filters are applied.
 
         Parameters
         ----------
-        error_code: str
-        msg : str
+        error_code: Optional[str]
 
         Returns
         -------
         Optional[str]
-            Returns the new status, or None if it should be filtered
         """
         if self.select is ALL or error_code in self.select:
-            return 'error' if not match(self.error_filters, msg) else None
+            return 'error'
 
         if self.ignore is ALL or error_code in self.ignore:
             return None
 
         if self.warn is ALL or error_code in self.warn:
-            return 'warning' if not match(self.warning_filters, msg) else None
+            return 'warning'
 
         if self.ignore or (self.select is not ALL and not self.select):
-            return 'error' if not match(self.error_filters, msg) else None
+            return 'error'
+
+        return None
+
+    def get_status(self, error_code, msg):
+        # type: (str, str) -> Optional[str]
+        """
+        Determine whether an error code is an error, warning, or ignored
+
+        Parameters
+        ----------
+        error_code: str
+        msg : str
+
+        Returns
+        -------
+        Optional[str]
+            Returns the new status, or None if it should be filtered
+        """
+        if self._status_map is None:
+            self.freeze()
+
+        status = self._status_map.get(error_code, self._default_status)
+        # message filters are rarely used, so avoid calling match() for nothing
+        if status == 'error':
+            if self.error_filters and match(self.error_filters, msg):
+                return None
+            return 'error'
+
+        if status == 'warning':
+            if self.warning_filters and match(self.warning_filters, msg):
+                return None
+            return 'warning'
 
         return None
 
 
+# the same messages tend to be reported many times over
+@lru_cache(maxsize=4096)
 def get_error_code(msg):
     # type: (str) -> Optional[str]
     """
@@ -240,10 +510,8 @@ def get_error_code(msg):
     -------
     Optional[str]
     """
-    for code, regex in FILTERS:
-        if regex.search(msg):
-            return code
-    return None
+    m = _COMBINED.search(msg)
+    return m.lastgroup if m else None
 
 
 def get_options(filename, global_options, module_options):
@@ -254,6 +522,86 @@ def get_options(filename, global_options, module_options):
     return global_options
 
 
+class BatchedWriter(object):
+    """
+    File-like object which collects writes and passes them on to a stream in
+    batches.
+    """
+    def __init__(self, stream, batch_size):
+        # type: (TextIO, int) -> None
+        self.stream = stream
+        self.batch_size = batch_size
+        self._pending = []  # type: List[str]
+
+    def write(self, text):
+        # type: (str) -> None
+        self._pending.append(text)
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        # type: () -> None
+        if self._pending:
+            self.stream.write(''.join(self._pending))
+            del self._pending[:]
+        self.stream.flush()
+
+
+def get_formatter(options):
+    # type: (Options) -> Callable[..., str]
+    """
+    Build a function which formats a report line, with the display options
+    looked up once rather than for every line.
+
+    The returned function takes the same arguments as `report`, minus
+    `options`.
+
+    Parameters
+    ----------
+    options : Options
+
+    Returns
+    -------
+    Callable[..., str]
+    """
+    show_ignored = options.show_ignored
+    show_error_keys = options.show_error_keys
+
+    if not options.color:
+        def format_line(filename, lineno, status, msg, is_filtered,
+                        error_key=None):
+            if show_error_keys and error_key:
+                msg = '%s: %s: %s' % (error_key, status, msg)
+            else:
+                msg = '%s: %s' % (status, msg)
+
+            prefix = 'IGNORED ' if show_ignored and is_filtered else ''
+            return '%s%s:%s: %s' % (prefix, filename, lineno, msg)
+
+    else:
+        prefixes = REPORT_PREFIXES
+        reset = TERM_RESET
+
+        def format_line(filename, lineno, status, msg, is_filtered,
+                        error_key=None):
+            dimmed = bool(show_ignored and is_filtered)
+            file_esc, lineno_esc, status_esc, key_esc = \
+                prefixes[status, dimmed]
+
+            if show_error_keys and error_key:
+                key = '%s%s: %s' % (key_esc, error_key, reset)
+            else:
+                key = ''
+            return '%s%s%s%s:%s: %s%s%s%s: %s%s%s%s' % (
+                file_esc, filename, reset,
+                lineno_esc, lineno, reset,
+                key,
+                status_esc, status, reset,
+                status_esc, msg, reset)
+
+    return format_line
+
+
 def report(options, filename, lineno, status, msg,
            is_filtered, error_key=None):
     # type: (Options, str, str, str, str, bool, Optional[str]) -> None
@@ -270,29 +618,62 @@ def report(options, filename, lineno, status, msg,
     is_filtered : bool
     error_key : Optional[str]
     """
-    if not options.color:
-        if options.show_error_keys and error_key:
-            msg = '%s: %s: %s' % (error_key, status, msg)
-        else:
-            msg = '%s: %s' % (status, msg)
+    format_line = get_formatter(options)
+    print(format_line(filename, lineno, status, msg, is_filtered, error_key))
 
-        outline = 'IGNORED ' if options.show_ignored and is_filtered else ''
-        outline += '%s:%s: %s' % (filename, lineno, msg)
 
-    else:
-        display_attrs = ['dark'] if options.show_ignored and is_filtered else None
+def read_ahead(fileno):
+    # type: (int) -> Iterator[str]
+    """
+    Iterate over the lines of a pipe, which is read ahead in a background
+    thread.
 
-        filename = colored(filename, 'cyan', attrs=display_attrs)
-        lineno = colored(':%s: ' % lineno, attrs=display_attrs)
-        color = COLORS[status]
-        status = colored(status + ': ', color, attrs=display_attrs)
-        if options.show_error_keys and error_key:
-            status = colored(error_key + ': ', 'magenta',
-                             attrs=display_attrs) + status
-        msg = colored(msg, color, attrs=display_attrs)
-        outline = filename + lineno + status + msg
+    This keeps the pipe from mypy drained while lines are being processed, so
+    mypy does not stall waiting on a full pipe.  Each read takes whatever
+    output is already available, so lines are passed on as soon as mypy
+    writes them, while large outputs are still handled in large blocks.
 
-    print(outline)
+    Parameters
+    ----------
+    fileno : int
+
+    Returns
+    -------
+    Iterator[str]
+    """
+    blocks = queue.Queue()  # type: queue.Queue
+    failure = []  # type: List[BaseException]
+
+    def read():
+        try:
+            while True:
+                block = os.read(fileno, _READ_BUFFER_SIZE)
+                if not block:
+                    break
+                blocks.put(block)
+        except BaseException as err:
+            failure.append(err)
+        finally:
+            blocks.put(b'')
+
+    reader = threading.Thread(target=read)
+    reader.daemon = True
+    reader.start()
+
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    partial = ''
+    for block in iter(blocks.get, b''):
+        lines = (partial + decoder.decode(block)).split('\n')
+        partial = lines.pop()
+        for line in lines:
+            yield line + '\n'
+    reader.join()
+    if failure:
+        raise failure[0]
+
+    partial += decoder.decode(b'', True)
+    if partial:
+        yield partial
 
 
 def run(active_files, global_options, module_options):
@@ -342,31 +723,58 @@ def run(active_files, global_options, module_options):
     filtered = defaultdict(int)  # type: DefaultDict[str, int]
     last_error = None  # type: Optional[Tuple[Options, Any, Any, Any, Optional[str]]]
 
-    for line in proc.stdout:
-        line = line.decode()
-        try:
-            filename, lineno, status, msg = line.split(':', 3)
-        except ValueError:
-            lineno = ''
-            try:
-                filename, status, msg = line.split(':', 2)
-            except ValueError:
-                print(line, end='')
+    # stream output to a terminal as it arrives, otherwise write in batches
+    if sys.stdout.isatty():
+        out = sys.stdout  # type: TextIO
+    else:
+        out = BatchedWriter(sys.stdout, _WRITE_BATCH_SIZE)
+
+    # bound once, since they are needed for every line of output
+    match_line = _LINE_RE.match
+    is_excluded_path = global_options.is_excluded_path
+    show_ignored = global_options.show_ignored
+    format_line = get_formatter(global_options)
+    write = out.write
+    # mypy reports many lines per file, and a file's options never change
+    file_options = {}  # type: Dict[str, Options]
+
+    # output is decoded a block at a time rather than line by line.  matching
+    # bytes instead would save little: block decoding is cheap, and most lines
+    # are reported, so they would need decoding anyway.
+    try:
+        for line in read_ahead(proc.stdout.fileno()):
+            m = match_line(line)
+            if not m:
+                write(line)
+                continue
+            filename, lineno, status, msg = m.groups('')
+
+            if is_excluded_path(filename):
+                filtered[filename] += 1
                 continue
 
-        if global_options.is_excluded_path(filename):
-            filtered[filename] += 1
-            continue
+            msg = msg.strip()
 
-        options = get_options(filename, global_options, module_options)
+            if status != 'error':
+                # notes are shown alongside the error they follow, and never
+                # need an error code of their own.  notes without a line number
+                # are context headers (e.g. 'In function "f":') for the errors
+                # which come after them, so they are dropped.
+                if status == 'note' and lineno and matched_error is not None:
+                    write(format_line(filename, lineno, status, msg,
+                                      not matched_error[0], matched_error[1]) + '\n')
+                continue
 
-        error_code = get_error_code(msg)
-        status = status.strip()
-        msg = msg.strip()
+            error_code = get_error_code(msg)
+            last_error = global_options, filename, lineno, msg, error_code
+            if not error_code:
+                continue
 
-        last_error = global_options, filename, lineno, msg, error_code
+            options = file_options.get(filename)
+            if options is None:
+                options = get_options(filename, global_options, module_options)
+                file_options[filename] = options
 
-        if error_code and status == 'error':
             new_status = options.get_status(error_code, msg)
             if new_status == 'error':
                 errors[filename] += 1
@@ -375,16 +783,14 @@ def run(active_files, global_options, module_options):
             elif new_status is None:
                 filtered[filename] += 1
 
-            if global_options.show_ignored or new_status:
-                report(global_options, filename, lineno, new_status or 'error',
-                       msg, not new_status, error_code)
+            if show_ignored or new_status:
+                write(format_line(filename, lineno, new_status or 'error',
+                                  msg, not new_status, error_code) + '\n')
                 matched_error = new_status, error_code
             else:
                 matched_error = None
-
-        elif status == 'note' and matched_error is not None:
-            report(global_options, filename, lineno, status, msg,
-                   not matched_error[0], matched_error[1])
+    finally:
+        out.flush()
 
     def print_stat(key, value):
         print("{:.<50}{:.>8}".format(key, value))
@@ -463,11 +869,15 @@ def main(argv=None):
         for key in Options.PER_MODULE_OPTIONS:
             setattr(options, key, getattr(override_options, key))
 
+    options.freeze()
+    for _, module_opts in module_options:
+        module_opts.freeze()
+
     # if options.select:
     #     options.select.add('invalid_syntax')
 
     if options.select and options.ignore:
-        overlap = options.select.intersection(options.ignore)
+        overlap = options.select & options.ignore
         if overlap:
             print('The same option must not be both selected and '
                   'ignored: %s' % ', '.join(overlap), file=sys.stderr)
@@ -476,10 +886,6 @@ def main(argv=None):
     # _validate(options.select, error_codes)
     # _validate(options.ignore, error_codes)
     # _validate(options.warn, error_codes)
-    #
-    # unused = set(error_codes).difference(options.ignore)
-    # unused = unused.difference(options.select)
-    # _validate(unused, error_codes)
 
     sys.exit(run(dummy.files, options, module_options))
 
@@ -534,6 +940,14 @@ def _glob_list(s):
     return [_glob_to_regex(x) for x in _parse_multi_options(s)]
 
 
+def _glob_union(s):
+    # type: (str) -> Optional[Pattern]
+    globs = _parse_multi_options(s)
+    if not globs:
+        return None
+    return re.compile('|'.join('(?:%s)' % fnmatch.translate(x) for x in globs))
+
+
 def _regex_list(s):
     # type: (str) -> List[Pattern]
     return [re.compile(x) for x in _parse_multi_options(s)]
@@ -553,12 +967,18 @@ config_types = {
     'warn': _error_set,
     'args':  _parse_multi_options,
     'include': _glob_list,
-    'exclude': _glob_list,
+    'exclude': _glob_union,
     'error_filters': _regex_list,
     'warning_filters': _regex_list,
 }
 
 
+@lru_cache(maxsize=None)
+def _resolved_config_paths():
+    # type: () -> Tuple[str, ...]
+    return tuple(os.path.expanduser(p) for p in CONFIG_FILES)
+
+
 class BaseOptionsParser(object):
     def extract_updates(self, options):
         # type: (Options) -> Iterator[Tuple[Dict[str, object], Optional[str]]]
@@ -629,7 +1049,7 @@ class ConfigFileOptionsParser(BaseOptionsParser):
         if self.filename is not None:
             config_files = (self.filename,)  # type: Tuple[str, ...]
         else:
-            config_files = tuple(map(os.path.expanduser, CONFIG_FILES))
+            config_files = _resolved_config_paths()
 
         parser = configparser.RawConfigParser()
 
@@ -776,7 +1196,7 @@ def get_parser():
                         help="Errors to check")
     parser.add_argument("--ignore",  "-i", nargs="+", type=str,
                         help="Errors to skip")
-    parser.add_argument("--warn",  "-w",
+    parser.add_argument("--warn",  "-w", type=_error_set,
                         help="Errors to convert into warnings (comma separated)")
     add_invertible_flag("--color",
                         help="Colorize output")
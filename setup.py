@@ -22,7 +22,10 @@ setup(
     entry_points={
         'console_scripts': ['mypyrun=mypyrun:main'],
     },
-    install_requires=['configparser'],
+    install_requires=[
+        'configparser',
+        'backports.functools_lru_cache; python_version < "3"',
+    ],
     extras_require={
         "tests": [
             "coverage",
@@ -0,0 +1,384 @@
+from __future__ import absolute_import, print_function
+
+import os
+import re
+import sys
+import threading
+import time
+
+import pytest
+
+import mypyrun
+
+
+@pytest.mark.parametrize('msg, code', [
+    ('Revealed type is "builtins.int"', 'revealed_type'),
+    ('Name "foo" is not defined', 'not_defined'),
+    ('Return value expected', 'return_expected'),
+    ('No return value expected', 'return_not_expected'),
+    ('Incompatible return value type (got "None", expected "int")',
+     'incompatible_return'),
+    ('Argument 1 to "f" has incompatible type "str"; expected "int"',
+     'incompatible_arg'),
+    ('Signature of "f" incompatible with supertype "A"',
+     'incompatible_subclass_signature'),
+    ('Return type "int" of "f" incompatible with supertype "A"',
+     'incompatible_subclass_return'),
+    ('Argument 1 of "f" incompatible with supertype "A"',
+     'incompatible_subclass_arg'),
+    ("Name 'x' already defined on line 3", 'already_defined'),
+    ('"int" not callable', 'not_callable'),
+    ('"A" has no attribute "y"', 'no_attr'),
+    ('Value of type "int" is not indexable', 'not_indexable'),
+    ('"Foo" not iterable', 'not_iterable'),
+    ('"f" does not return a value', 'invalid_return_assignment'),
+    ('Unsupported operand types for + ("int" and "str")',
+     'unsupported_operand'),
+    ('Unsupported left operand type for + ("A")', 'unsupported_operand'),
+    ('Unsupported target for indexed assignment', 'not_assignable_by_index'),
+    ("Cannot find module named 'zzz'", 'missing_module'),
+    ("Cannot instantiate abstract class 'A' with abstract attribute 'f'",
+     'abc_with_abstract_attr'),
+    ('Overloaded function signature 2 will never be matched',
+     'orphaned_overload'),
+    ('Something totally unknown happened', None),
+    # special cases listed ahead of their general form:
+    ('Item "None" of "Optional[A]" has no attribute "x"', 'no_attr_none_case'),
+    ('Incompatible types in assignment (expression has type "int", base '
+     'class "A" defined the type as "str")', 'incompatible_subclass_attr'),
+    ('Incompatible types in assignment (expression has type "int", '
+     'variable has type "str")', 'incompatible_assignment'),
+    # both subclass-attr filters match at the start; the first listed wins
+    ('Incompatible types in assignment (expression has type "int", base '
+     'class "A" defined the type as "None")', 'incompatible_subclass_attr'),
+    # anchored filters only match at the start of the message
+    ('Name "Return value expected" is not defined', 'not_defined'),
+    # the earliest match in the message wins
+    ('"Return value expected" not callable', 'not_callable'),
+])
+def test_get_error_code(msg, code):
+    assert mypyrun.get_error_code(msg) == code
+
+
+def _first_match(msg, filters=mypyrun._FILTERS):
+    # the documented order, one filter at a time: the earliest match wins,
+    # with anchored filters first, then ties go to the filter listed first
+    matches = []
+    for i, (code, pattern) in enumerate(filters):
+        m = re.search(pattern, msg)
+        if m:
+            anchored = pattern.startswith('^') and \
+                not mypyrun._has_top_level_alternation(pattern)
+            matches.append((m.start(), not anchored, i, code))
+    return min(matches)[3] if matches else None
+
+
+@pytest.mark.parametrize('msg', [
+    'Return value expected',
+    'Name "x" is not defined',
+    'Item "None" of "Optional[A]" has no attribute "x"',
+    'Incompatible types in assignment (expression has type "int", base '
+    'class "A" defined the type as "None")',
+    '"None" has no attribute "x"; "Foo" not callable',
+    'Module "m" has no attribute "x", and "y" is not defined',
+    '"List" expects 1 type argument, but 2 given',
+    'Argument 1 of "f" has incompatible type "A"; incompatible with supertype',
+])
+def test_combined_matches_filters(msg):
+    assert mypyrun.get_error_code(msg) == _first_match(msg)
+
+
+@pytest.mark.parametrize('filters, msg', [
+    # a top-level `|` must not share the leading character or the `^`
+    ([('x', 'ab|cd')], 'cd'),
+    ([('x', '^ab|cd')], 'zcd'),
+    ([('y', 'az'), ('x', 'ab|cd')], 'cd'),
+    ([('y', '^zz'), ('x', '^ab|cd')], 'zcd'),
+    # a filter without a leading literal can tie with any other, so later
+    # filters must not be moved ahead of it
+    ([('p', ' y'), ('q', '.*x'), ('r', ' x')], ' x'),
+    ([('p', ' y'), ('q', '(?: x)'), ('r', ' x')], 'a x'),
+    ([('p', ' x'), ('q', '.*x'), ('r', ' x')], ' x'),
+])
+def test_combine_order(filters, msg):
+    m = mypyrun._combine(filters).search(msg)
+    assert (m.lastgroup if m else None) == _first_match(msg, filters)
+    assert m is not None
+
+
+@pytest.mark.parametrize('pattern, expected', [
+    ('ab|cd', True),
+    ('^ab|cd', True),
+    ('(?:a|b)|c', True),
+    ('a(b|c)', False),
+    ('a\\|b', False),
+    ('a[|]', False),
+    ('[]|]', False),
+    ('[^]|]x', False),
+    ('[\\]|]', False),
+])
+def test_has_top_level_alternation(pattern, expected):
+    assert mypyrun._has_top_level_alternation(pattern) == expected
+
+
+@pytest.mark.parametrize('pattern, expected', [
+    ('Return value', ('R', 'eturn value')),
+    ('ab*', ('a', 'b*')),
+    ('a*', (None, 'a*')),
+    ('a{2}', (None, 'a{2}')),
+    ('.* has', (None, '.* has')),
+    ('\\(x', (None, '\\(x')),
+    ('(?:".*")', (None, '(?:".*")')),
+])
+def test_split_leading_literal(pattern, expected):
+    assert mypyrun._split_leading_literal(pattern) == expected
+
+
+@pytest.mark.parametrize('line, groups', [
+    ('pkg/a.py:12: error: Return value expected\n',
+     ('pkg/a.py', '12', 'error', 'Return value expected')),
+    ('pkg/a.py:3: note:   Consider using "Sequence"\n',
+     ('pkg/a.py', '3', 'note', 'Consider using "Sequence"')),
+    ('pkg/a.py: note: In function "f":\n',
+     ('pkg/a.py', '', 'note', 'In function "f":')),
+    ('pkg/a.py:10: warning: unused \'type: ignore\' comment\n',
+     ('pkg/a.py', '10', 'warning', 'unused \'type: ignore\' comment')),
+    # show_column_numbers
+    ('pkg/a.py:12:5: error: Return value expected\n',
+     ('pkg/a.py', '12', 'error', 'Return value expected')),
+    # show_error_end
+    ('pkg/a.py:12:5:12:9: error: Return value expected\n',
+     ('pkg/a.py', '12', 'error', 'Return value expected')),
+])
+def test_line_re(line, groups):
+    m = mypyrun._LINE_RE.match(line)
+    assert m is not None
+    assert m.groups('') == groups
+
+
+@pytest.mark.parametrize('line', [
+    'Found 3 errors in 2 files (checked 5 source files)\n',
+    'Success: no issues found in 3 source files\n',
+    'pkg/a.py:x: error: Return value expected\n',
+    '\n',
+])
+def test_line_re_unparseable(line):
+    assert mypyrun._LINE_RE.match(line) is None
+
+
+def _read_pipe(chunks):
+    # feed chunks of bytes into a pipe from another thread, pausing between
+    # them so each arrives in a separate read
+    rfd, wfd = os.pipe()
+
+    def write():
+        with os.fdopen(wfd, 'wb', 0) as f:
+            for chunk in chunks:
+                f.write(chunk)
+                time.sleep(0.01)
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    try:
+        return list(mypyrun.read_ahead(rfd))
+    finally:
+        writer.join()
+        os.close(rfd)
+
+
+@pytest.mark.parametrize('chunks, lines', [
+    ([b'a.py:1: error: x\n', b'a.py:2: error: y\n'],
+     ['a.py:1: error: x\n', 'a.py:2: error: y\n']),
+    # a line split across reads
+    ([b'a.py:1: err', b'or: x\nb.py', b':2: error: y\n'],
+     ['a.py:1: error: x\n', 'b.py:2: error: y\n']),
+    # a multi-byte character split across reads
+    ([b'caf\xc3', b'\xa9\n'], [u'caf\xe9\n']),
+    ([b'\n', b'x\n\n', b'\n'], ['\n', 'x\n', '\n', '\n']),
+    # no newline at the end of the output
+    ([b'x\n', b'y'], ['x\n', 'y']),
+    ([b'x\ny'], ['x\n', 'y']),
+    ([b'\xff\n'], [u'\ufffd\n']),
+    ([], []),
+])
+def test_read_ahead(chunks, lines):
+    assert _read_pipe(chunks) == lines
+
+
+def test_read_ahead_single_bytes(monkeypatch):
+    # every read returns one byte, splitting every character and line
+    monkeypatch.setattr(mypyrun, '_READ_BUFFER_SIZE', 1)
+    data = u'a.py:1: error: caf\xe9 \u2603\n\nlast'
+    assert _read_pipe([data.encode('utf-8')]) == \
+        [u'a.py:1: error: caf\xe9 \u2603\n', '\n', 'last']
+
+
+def test_read_ahead_reraises_reader_error():
+    rfd, wfd = os.pipe()
+    os.close(rfd)
+    os.close(wfd)
+    with pytest.raises(OSError):
+        list(mypyrun.read_ahead(rfd))
+
+
+def _options(**kwargs):
+    options = mypyrun.Options()
+    for key, value in kwargs.items():
+        setattr(options, key, value)
+    return options
+
+
+# (color, show_ignored, show_error_keys), (status, is_filtered, error_key)
+@pytest.mark.parametrize('display, line, expected', [
+    ((False, False, False), ('error', False, 'no_attr'),
+     'a.py:12: error: msg'),
+    ((False, False, True), ('error', False, 'no_attr'),
+     'a.py:12: no_attr: error: msg'),
+    ((False, False, True), ('warning', False, None),
+     'a.py:12: warning: msg'),
+    ((False, False, False), ('note', False, None),
+     'a.py:12: note: msg'),
+    ((False, True, False), ('error', True, 'no_attr'),
+     'IGNORED a.py:12: error: msg'),
+    ((False, True, True), ('note', True, 'no_attr'),
+     'IGNORED a.py:12: no_attr: note: msg'),
+    ((False, False, False), ('error', True, 'no_attr'),
+     'a.py:12: error: msg'),
+    ((True, False, False), ('error', False, 'no_attr'),
+     '\x1b[36ma.py\x1b[0m:12: \x1b[0m'
+     '\x1b[31merror: \x1b[0m\x1b[31mmsg\x1b[0m'),
+    ((True, False, True), ('warning', False, 'no_attr'),
+     '\x1b[36ma.py\x1b[0m:12: \x1b[0m\x1b[35mno_attr: \x1b[0m'
+     '\x1b[33mwarning: \x1b[0m\x1b[33mmsg\x1b[0m'),
+    ((True, False, True), ('note', False, None),
+     '\x1b[36ma.py\x1b[0m:12: \x1b[0mnote: \x1b[0mmsg\x1b[0m'),
+    ((True, True, True), ('error', True, 'no_attr'),
+     '\x1b[2m\x1b[36ma.py\x1b[0m\x1b[2m:12: \x1b[0m'
+     '\x1b[2m\x1b[35mno_attr: \x1b[0m'
+     '\x1b[2m\x1b[31merror: \x1b[0m\x1b[2m\x1b[31mmsg\x1b[0m'),
+    ((True, True, False), ('note', True, None),
+     '\x1b[2m\x1b[36ma.py\x1b[0m\x1b[2m:12: \x1b[0m'
+     '\x1b[2mnote: \x1b[0m\x1b[2mmsg\x1b[0m'),
+    ((True, False, False), ('error', True, None),
+     '\x1b[36ma.py\x1b[0m:12: \x1b[0m'
+     '\x1b[31merror: \x1b[0m\x1b[31mmsg\x1b[0m'),
+])
+def test_format_line(display, line, expected, capsys):
+    color, show_ignored, show_error_keys = display
+    status, is_filtered, error_key = line
+    options = _options(color=color, show_ignored=show_ignored,
+                       show_error_keys=show_error_keys)
+    format_line = mypyrun.get_formatter(options)
+    assert format_line('a.py', '12', status, 'msg', is_filtered,
+                       error_key) == expected
+
+    mypyrun.report(options, 'a.py', '12', status, 'msg', is_filtered,
+                   error_key)
+    assert capsys.readouterr().out == expected + '\n'
+
+
+class _Stream(object):
+    def __init__(self):
+        self.writes = []
+        self.flushes = 0
+
+    def write(self, text):
+        self.writes.append(text)
+
+    def flush(self):
+        self.flushes += 1
+
+
+def test_batched_writer():
+    stream = _Stream()
+    out = mypyrun.BatchedWriter(stream, 3)
+    out.write('a')
+    out.write('b')
+    assert stream.writes == []
+    out.write('c')
+    assert stream.writes == ['abc']
+    out.write('d')
+    assert stream.writes == ['abc']
+    out.flush()
+    assert stream.writes == ['abc', 'd']
+    # nothing pending: the stream is flushed, but not written to
+    out.flush()
+    assert stream.writes == ['abc', 'd']
+    assert stream.flushes == 3
+
+
+_MYPY_OUTPUT = '''\
+a.py: note: In function "f":
+a.py:1: error: Return value expected
+a.py:1: note: reported error
+a.py:2: error: "int" not callable
+a.py:2: note: filtered error
+a.py:4: error: Name "x" is not defined
+a.py:4: note: warning
+skip/c.py:1: error: Return value expected
+b.py:5:3: error: Return value expected
+Found 4 errors in 3 files
+'''
+
+
+def _fake_mypy(tmpdir, output, returncode):
+    # `run` looks for mypy next to `mypy_executable`
+    script = tmpdir.join('mypy')
+    script.write('#!%s\nimport sys\nsys.stdout.write(%r)\nsys.exit(%d)\n'
+                 % (sys.executable, output, returncode))
+    script.chmod(0o755)
+    return str(script)
+
+
+@pytest.mark.parametrize('show_ignored, lines', [
+    (False, [
+        'a.py:1: return_expected: error: Return value expected',
+        'a.py:1: return_expected: note: reported error',
+        'a.py:4: not_defined: warning: Name "x" is not defined',
+        'a.py:4: not_defined: note: warning',
+        'b.py:5: return_expected: error: Return value expected',
+        'Found 4 errors in 3 files',
+    ]),
+    (True, [
+        'a.py:1: return_expected: error: Return value expected',
+        'a.py:1: return_expected: note: reported error',
+        'IGNORED a.py:2: not_callable: error: "int" not callable',
+        'IGNORED a.py:2: not_callable: note: filtered error',
+        'a.py:4: not_defined: warning: Name "x" is not defined',
+        'a.py:4: not_defined: note: warning',
+        'b.py:5: return_expected: error: Return value expected',
+        'Found 4 errors in 3 files',
+    ]),
+])
+def test_run(show_ignored, lines, tmpdir, capsys):
+    options = _options(
+        color=False, show_ignored=show_ignored, show_error_keys=True,
+        select=set(), ignore={'not_callable'}, warn={'not_defined'},
+        exclude=re.compile('^skip/'),
+        mypy_executable=_fake_mypy(tmpdir, _MYPY_OUTPUT, 1))
+    options.freeze()
+
+    assert mypyrun.run(None, options, []) == 1
+
+    out = capsys.readouterr().out.split('\n')
+    stats = out.index('')
+    assert out[:stats] == lines
+    assert out[stats + 1:stats + 6] == [
+        '{:.<50}{:.>8}'.format(key, value) for key, value in [
+            ('Errors', 2),
+            ('Warnings', 1),
+            ('Filtered', 2),
+            ('Files with errors or warnings (excluding filtered)', 2),
+            ('Files with errors or warnings (including filtered)', 3),
+        ]
+    ]
+
+
+def test_run_no_errors(tmpdir, capsys):
+    output = 'a.py:2: error: "int" not callable\na.py:2: note: filtered\n'
+    options = _options(color=False, select=set(), ignore={'not_callable'},
+                       mypy_executable=_fake_mypy(tmpdir, output, 1))
+    options.freeze()
+
+    assert mypyrun.run(None, options, []) == 0
+    assert capsys.readouterr().out.startswith('\nErrors')